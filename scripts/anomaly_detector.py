@@ -6,10 +6,124 @@ Uses statistical analysis and machine learning to detect unusual network behavio
 
 import numpy as np
 import json
+import socket
+import struct
 import time
-from datetime import datetime, timedelta
-from collections import defaultdict, deque
-import statistics
+from collections import Counter, defaultdict, deque
+
+def ip_to_int(ip):
+    """Convert a dotted-quad IPv4 address to a uint32 key (0 if invalid)"""
+    try:
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+    except (OSError, TypeError):
+        return 0
+
+def int_to_ip(value):
+    """Convert a uint32 key back to a dotted-quad IPv4 address"""
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+class IPHistory:
+    """Per-IP traffic count history for every tracked IP, stored as one 2-D ring
+    buffer (one row per IP) with rolling mean/variance updated for all rows at once.
+    
+    Each row also caches the Z-score of its current count, refreshed only for rows
+    whose count or history changed, and `max_z` tracks the largest of them."""
+    def __init__(self, window=100, capacity=256, min_samples=10):
+        self.window = window
+        self.min_samples = min_samples
+        self.index = {}  # ip -> row
+        self.ips = []    # row -> ip
+        self.buf = np.zeros((capacity, window), dtype=np.float32)
+        self.idx = np.zeros(capacity, dtype=np.intp)
+        self.n = np.zeros(capacity, dtype=np.intp)
+        self.mean = np.zeros(capacity, dtype=np.float64)
+        self.m2 = np.zeros(capacity, dtype=np.float64)
+        self.current = np.zeros(capacity, dtype=np.int64)
+        self.z = np.zeros(capacity, dtype=np.float64)
+        self.max_z = 0.0
+        self._max_row = -1
+        self._active = np.empty(0, dtype=np.intp)  # rows with a nonzero count this tick
+    
+    def __len__(self):
+        return len(self.ips)
+    
+    def _rows(self, ips):
+        """Row numbers for `ips`, allocating rows for IPs seen for the first time"""
+        index = self.index
+        for ip in ips:
+            if ip not in index:
+                index[ip] = len(self.ips)
+                self.ips.append(ip)
+        
+        if len(self.ips) > self.n.size:
+            self._grow(len(self.ips))
+        
+        return np.fromiter((index[ip] for ip in ips), dtype=np.intp, count=len(ips))
+    
+    def _grow(self, needed):
+        """Enlarge every per-row array to hold at least `needed` rows"""
+        capacity = self.n.size
+        while capacity < needed:
+            capacity *= 2
+        for name in ('buf', 'idx', 'n', 'mean', 'm2', 'current', 'z'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:old.shape[0]] = old
+            setattr(self, name, new)
+    
+    def append(self, ips, counts):
+        """Record this tick's count for each IP in `ips` (IPs not listed count as 0)"""
+        rows = self._rows(ips)
+        x = np.asarray(counts, dtype=np.float64)
+        
+        slots = self.idx[rows]
+        full = self.n[rows] == self.window
+        n = self.n[rows] + ~full
+        mean = self.mean[rows]
+        old = self.buf[rows, slots].astype(np.float64)
+        
+        # Welford: growing rows add a sample, full rows swap the oldest sample for x
+        new_mean = np.where(full, mean + (x - old) / n, mean + (x - mean) / n)
+        self.m2[rows] += np.where(full, (x - old) * (x - new_mean + old - mean),
+                                  (x - mean) * (x - new_mean))
+        self.mean[rows] = new_mean
+        self.n[rows] = n
+        self.buf[rows, slots] = x
+        self.idx[rows] = (slots + 1) % self.window
+        
+        # Only rows counted last tick or this tick can have a different Z-score
+        changed = np.union1d(self._active, rows)
+        self.current[self._active] = 0
+        self.current[rows] = counts
+        self._active = rows
+        self._update_z(changed)
+    
+    def _update_z(self, rows):
+        """Refresh cached Z-scores for `rows` and the running maximum"""
+        std = self.std(rows)
+        valid = (std > 0) & (self.n[rows] >= self.min_samples)
+        z = np.zeros(rows.size, dtype=np.float64)
+        np.divide(np.abs(self.current[rows] - self.mean[rows]), std, out=z, where=valid)
+        self.z[rows] = z
+        
+        if (rows == self._max_row).any():
+            # The previous maximum may have dropped; rescan every row
+            self._max_row = int(np.argmax(self.z[:len(self.ips)]))
+            self.max_z = float(self.z[self._max_row])
+        elif z.size and z.max() > self.max_z:
+            best = int(np.argmax(z))
+            self._max_row = int(rows[best])
+            self.max_z = float(z[best])
+    
+    def std(self, rows):
+        """Sample standard deviation per row (0 for constant or too-short history)"""
+        n = self.n[rows]
+        m2 = self.m2[rows]
+        # Ignore rounding residue left behind by the rolling update
+        valid = (n > 1) & (m2 >= 1e-6)
+        result = np.zeros(rows.size, dtype=np.float64)
+        np.sqrt(m2 / np.maximum(n - 1, 1), out=result, where=valid)
+        return result
 
 class AnomalyDetector:
     def __init__(self):
@@ -17,13 +131,20 @@ class AnomalyDetector:
         self.baseline_established = False
         self.baseline_period = 3600  # 1 hour to establish baseline
         self.start_time = time.time()
-        self.alerts = []
+        self.alerts = deque(maxlen=1000)  # Oldest alerts are evicted (and unindexed) first
+        self._alerts_by_id = {}
         
         # Traffic metrics
         self.packet_rates = deque(maxlen=100)
         self.connection_counts = deque(maxlen=100)
         self.port_distributions = deque(maxlen=100)
-        self.ip_frequencies = defaultdict(deque)
+        self.ip_frequencies = IPHistory()
+        
+        # Recent traffic window of (timestamp, source_ip_int, dest_port), oldest first
+        self.window_seconds = 60
+        self._window = deque()
+        self._port_counts = Counter()
+        self._ip_counts = Counter()
         
         # Thresholds (will be calculated from baseline)
         self.thresholds = {
@@ -38,32 +159,74 @@ class AnomalyDetector:
             'packet_rate': 0,
             'connection_count': 0,
             'unique_ports': set(),
-            'ip_counts': defaultdict(int)
+            'ip_counts': Counter()
         }
     
-    def update_metrics(self, traffic_data):
+    def add_packet(self, ts, source_ip, dest_port):
+        """Push one packet (source_ip as a uint32) into the recent traffic window"""
+        self._window.append((ts, source_ip, dest_port))
+        self._port_counts[dest_port] += 1
+        self._ip_counts[source_ip] += 1
+        self._expire(ts)
+    
+    def add_packets(self, timestamps, source_ips, dest_ports):
+        """Push a batch of packets given as parallel arrays (source IPs as uint32)"""
+        timestamps = np.asarray(timestamps).tolist()
+        source_ips = np.asarray(source_ips).tolist()
+        dest_ports = np.asarray(dest_ports).tolist()
+        if not timestamps:
+            return
+        
+        self._window.extend(zip(timestamps, source_ips, dest_ports))
+        self._port_counts.update(dest_ports)
+        self._ip_counts.update(source_ips)
+        self._expire(timestamps[-1])
+    
+    def record_traffic(self, traffic_data):
+        """Push a list of traffic entry dicts into the recent traffic window
+        (entries may carry a pre-parsed 'source_ip_int' instead of 'source_ip')"""
+        for entry in traffic_data:
+            source_ip = entry.get('source_ip_int')
+            if source_ip is None:
+                source_ip = ip_to_int(entry.get('source_ip', ''))
+            self.add_packet(entry.get('timestamp', 0), source_ip, entry.get('dest_port', 0))
+    
+    def _expire(self, now):
+        """Drop packets that have fallen out of the recent traffic window"""
+        window = self._window
+        port_counts = self._port_counts
+        ip_counts = self._ip_counts
+        cutoff = now - self.window_seconds
+        while window and window[0][0] <= cutoff:
+            _, source_ip, dest_port = window.popleft()
+            
+            count = port_counts[dest_port]
+            if count == 1:
+                del port_counts[dest_port]
+            else:
+                port_counts[dest_port] = count - 1
+            
+            count = ip_counts[source_ip]
+            if count == 1:
+                del ip_counts[source_ip]
+            else:
+                ip_counts[source_ip] = count - 1
+    
+    def update_metrics(self, traffic_data=None):
         """Update current traffic metrics"""
-        current_time = time.time()
-        
-        # Reset current metrics
-        self.current_metrics = {
-            'packet_rate': 0,
-            'connection_count': 0,
-            'unique_ports': set(),
-            'ip_counts': defaultdict(int)
-        }
+        if traffic_data:
+            self.record_traffic(traffic_data)
         
         # Analyze recent traffic (last 60 seconds)
-        recent_traffic = [
-            entry for entry in traffic_data 
-            if current_time - entry.get('timestamp', 0) < 60
-        ]
+        self._expire(time.time())
+        packet_count = len(self._window)
         
-        for entry in recent_traffic:
-            self.current_metrics['packet_rate'] += 1
-            self.current_metrics['connection_count'] += 1
-            self.current_metrics['unique_ports'].add(entry.get('dest_port', 0))
-            self.current_metrics['ip_counts'][entry.get('source_ip', '')] += 1
+        self.current_metrics = {
+            'packet_rate': packet_count,
+            'connection_count': packet_count,
+            'unique_ports': self._port_counts,
+            'ip_counts': self._ip_counts
+        }
         
         # Store metrics for baseline calculation
         self.packet_rates.append(self.current_metrics['packet_rate'])
@@ -71,10 +234,8 @@ class AnomalyDetector:
         self.port_distributions.append(len(self.current_metrics['unique_ports']))
         
         # Update IP frequency tracking
-        for ip, count in self.current_metrics['ip_counts'].items():
-            self.ip_frequencies[ip].append(count)
-            if len(self.ip_frequencies[ip]) > 100:
-                self.ip_frequencies[ip].popleft()
+        ip_counts = self.current_metrics['ip_counts']
+        self.ip_frequencies.append(list(ip_counts), list(ip_counts.values()))
     
     def establish_baseline(self):
         """Establish baseline behavior patterns"""
@@ -84,15 +245,25 @@ class AnomalyDetector:
         if len(self.packet_rates) < 50:  # Need minimum data points
             return False
         
-        # Calculate baseline statistics
+        # Calculate baseline statistics (one row per metric; the deques fill in lockstep)
+        count = len(self.packet_rates)
+        samples = np.empty((3, count), dtype=np.float64)
+        for row, history in enumerate((self.packet_rates, self.connection_counts, self.port_distributions)):
+            samples[row] = np.fromiter(history, dtype=np.float64, count=count)
+        
+        # Baseline vectors for the packet rate, connection count and port count features
+        self._mean_vec = samples.mean(axis=1)
+        self._std_vec = samples.std(axis=1, ddof=1)
+        
         self.baseline = {
-            'packet_rate_mean': statistics.mean(self.packet_rates),
-            'packet_rate_std': statistics.stdev(self.packet_rates) if len(self.packet_rates) > 1 else 0,
-            'connection_count_mean': statistics.mean(self.connection_counts),
-            'connection_count_std': statistics.stdev(self.connection_counts) if len(self.connection_counts) > 1 else 0,
-            'port_count_mean': statistics.mean(self.port_distributions),
-            'port_count_std': statistics.stdev(self.port_distributions) if len(self.port_distributions) > 1 else 0
+            'packet_rate_mean': float(self._mean_vec[0]),
+            'packet_rate_std': float(self._std_vec[0]),
+            'connection_count_mean': float(self._mean_vec[1]),
+            'connection_count_std': float(self._std_vec[1]),
+            'port_count_mean': float(self._mean_vec[2]),
+            'port_count_std': float(self._std_vec[2])
         }
+        self._refresh_limits()
         
         self.baseline_established = True
         print("Baseline established:")
@@ -101,120 +272,82 @@ class AnomalyDetector:
         
         return True
     
-    def detect_packet_rate_anomaly(self):
-        """Detect unusual packet rates"""
-        if not self.baseline_established:
-            return None
-        
-        current_rate = self.current_metrics['packet_rate']
-        mean = self.baseline['packet_rate_mean']
-        std = self.baseline['packet_rate_std']
-        
-        if std == 0:
-            return None
-        
-        z_score = abs(current_rate - mean) / std
-        threshold = self.thresholds['packet_rate_std_multiplier']
-        
-        if z_score > threshold:
-            severity = 'high' if z_score > threshold * 1.5 else 'medium'
-            return {
-                'type': 'packet_rate_anomaly',
-                'severity': severity,
-                'current_value': current_rate,
-                'expected_range': f"{mean - std:.1f} - {mean + std:.1f}",
-                'z_score': z_score
-            }
-        
-        return None
+    def _refresh_limits(self):
+        """Cache threshold * std for the baseline features so detection needs no divide"""
+        self._threshold_vec = np.array([self.thresholds['packet_rate_std_multiplier'],
+                                        self.thresholds['connection_count_std_multiplier'],
+                                        self.thresholds['connection_count_std_multiplier']],
+                                       dtype=np.float64)
+        # A zero std never flags, matching the Z-score definition
+        self._limit_vec = np.where(self._std_vec > 0, self._threshold_vec * self._std_vec, np.inf)
     
-    def detect_connection_anomaly(self):
-        """Detect unusual connection patterns"""
-        if not self.baseline_established:
-            return None
-        
-        current_count = self.current_metrics['connection_count']
-        mean = self.baseline['connection_count_mean']
-        std = self.baseline['connection_count_std']
-        
-        if std == 0:
-            return None
-        
-        z_score = abs(current_count - mean) / std
-        threshold = self.thresholds['connection_count_std_multiplier']
-        
-        if z_score > threshold:
-            severity = 'high' if z_score > threshold * 1.5 else 'medium'
-            return {
-                'type': 'connection_anomaly',
-                'severity': severity,
-                'current_value': current_count,
-                'expected_range': f"{mean - std:.1f} - {mean + std:.1f}",
-                'z_score': z_score
-            }
-        
-        return None
+    def update_thresholds(self, thresholds):
+        """Update detection thresholds and refresh the cached baseline limits"""
+        self.thresholds.update(thresholds)
+        if self.baseline_established:
+            self._refresh_limits()
     
-    def detect_port_anomaly(self):
-        """Detect unusual port usage patterns"""
+    def detect_anomalies(self):
+        """Detect packet rate, connection, port usage and IP frequency anomalies"""
         if not self.baseline_established:
-            return None
-        
-        current_ports = len(self.current_metrics['unique_ports'])
-        mean = self.baseline['port_count_mean']
-        std = self.baseline['port_count_std']
-        
-        if std == 0:
-            return None
+            return []
         
-        z_score = abs(current_ports - mean) / std
-        threshold = self.thresholds['connection_count_std_multiplier']
+        metrics = self.current_metrics
         
-        if z_score > threshold:
-            severity = 'medium' if z_score > threshold * 1.2 else 'low'
-            return {
-                'type': 'port_usage_anomaly',
-                'severity': severity,
-                'current_value': current_ports,
-                'expected_range': f"{mean - std:.1f} - {mean + std:.1f}",
-                'z_score': z_score,
-                'unusual_ports': list(self.current_metrics['unique_ports'])
-            }
+        # Baseline features (packet rate, connection count, port count) in one pass;
+        # |x - mean| > threshold * std is the Z-score test without the per-feature divide
+        values = [metrics['packet_rate'], metrics['connection_count'], len(metrics['unique_ports'])]
+        deviations = np.abs(np.array(values, dtype=np.float64) - self._mean_vec)
         
-        return None
-    
-    def detect_ip_frequency_anomaly(self):
-        """Detect IPs with unusual traffic frequency"""
         anomalies = []
-        
-        for ip, counts in self.ip_frequencies.items():
-            if len(counts) < 10:  # Need minimum data points
-                continue
-            
-            current_count = self.current_metrics['ip_counts'].get(ip, 0)
-            mean = statistics.mean(counts)
-            std = statistics.stdev(counts) if len(counts) > 1 else 0
-            
-            if std == 0:
-                continue
+        for i in np.nonzero(deviations > self._limit_vec)[0].tolist():
+            mean = self._mean_vec[i]
+            std = self._std_vec[i]
+            z_score = float(deviations[i] / std)
+            threshold = float(self._threshold_vec[i])
+            expected_range = f"{mean - std:.1f} - {mean + std:.1f}"
             
-            z_score = abs(current_count - mean) / std
-            threshold = self.thresholds['ip_frequency_std_multiplier']
-            
-            if z_score > threshold:
-                severity = 'high' if z_score > threshold * 1.5 else 'medium'
+            if i == 2:
                 anomalies.append({
-                    'type': 'ip_frequency_anomaly',
-                    'severity': severity,
-                    'ip_address': ip,
-                    'current_count': current_count,
-                    'expected_range': f"{mean - std:.1f} - {mean + std:.1f}",
+                    'type': 'port_usage_anomaly',
+                    'severity': 'medium' if z_score > threshold * 1.2 else 'low',
+                    'current_value': values[i],
+                    'expected_range': expected_range,
+                    'z_score': z_score,
+                    'unusual_ports': list(metrics['unique_ports'])
+                })
+            else:
+                anomalies.append({
+                    'type': 'packet_rate_anomaly' if i == 0 else 'connection_anomaly',
+                    'severity': 'high' if z_score > threshold * 1.5 else 'medium',
+                    'current_value': values[i],
+                    'expected_range': expected_range,
                     'z_score': z_score
                 })
         
-        return anomalies if anomalies else None
+        # IP frequencies: IPHistory keeps per-IP Z-scores current, so skip the
+        # scan entirely unless at least one IP is above the threshold
+        history = self.ip_frequencies
+        threshold = self.thresholds['ip_frequency_std_multiplier']
+        if history.max_z <= threshold:
+            return anomalies
+        
+        rows = np.nonzero(history.z[:len(history)] > threshold)[0]
+        for row, std in zip(rows.tolist(), history.std(rows).tolist()):
+            mean = history.mean[row]
+            z_score = float(history.z[row])
+            anomalies.append({
+                'type': 'ip_frequency_anomaly',
+                'severity': 'high' if z_score > threshold * 1.5 else 'medium',
+                'ip_address': int_to_ip(history.ips[row]),
+                'current_count': int(history.current[row]),
+                'expected_range': f"{mean - std:.1f} - {mean + std:.1f}",
+                'z_score': z_score
+            })
+        
+        return anomalies
     
-    def analyze_traffic(self, traffic_data):
+    def analyze_traffic(self, traffic_data=None):
         """Main analysis function"""
         self.update_metrics(traffic_data)
         
@@ -224,32 +357,27 @@ class AnomalyDetector:
             return []
         
         # Detect anomalies
-        anomalies = []
-        
-        # Check different types of anomalies
-        packet_anomaly = self.detect_packet_rate_anomaly()
-        if packet_anomaly:
-            anomalies.append(packet_anomaly)
-        
-        connection_anomaly = self.detect_connection_anomaly()
-        if connection_anomaly:
-            anomalies.append(connection_anomaly)
-        
-        port_anomaly = self.detect_port_anomaly()
-        if port_anomaly:
-            anomalies.append(port_anomaly)
-        
-        ip_anomalies = self.detect_ip_frequency_anomaly()
-        if ip_anomalies:
-            anomalies.extend(ip_anomalies)
+        anomalies = self.detect_anomalies()
         
         # Convert anomalies to alerts
         for anomaly in anomalies:
-            alert = self.create_alert(anomaly)
-            self.alerts.append(alert)
+            self._record_alert(self.create_alert(anomaly))
         
         return anomalies
     
+    def _record_alert(self, alert):
+        """Append an alert, keeping the id index in step with deque eviction"""
+        if len(self.alerts) == self.alerts.maxlen:
+            evicted = self.alerts[0]
+            if self._alerts_by_id.get(evicted['id']) is evicted:
+                del self._alerts_by_id[evicted['id']]
+        self.alerts.append(alert)
+        self._alerts_by_id[alert['id']] = alert
+    
+    def get_alert(self, alert_id):
+        """Look up a retained alert by id (None if unknown or evicted)"""
+        return self._alerts_by_id.get(alert_id)
+    
     def create_alert(self, anomaly):
         """Create alert from anomaly detection"""
         alert_id = f"anomaly_{int(time.time())}_{anomaly['type']}"
@@ -262,9 +390,9 @@ class AnomalyDetector:
         }
         
         description_map = {
-            'packet_rate_anomaly': f"Packet rate ({anomaly['current_value']}) significantly differs from baseline ({anomaly['expected_range']})",
-            'connection_anomaly': f"Connection count ({anomaly['current_value']}) outside normal range ({anomaly['expected_range']})",
-            'port_usage_anomaly': f"Port usage pattern ({anomaly['current_value']} unique ports) deviates from baseline",
+            'packet_rate_anomaly': f"Packet rate ({anomaly.get('current_value')}) significantly differs from baseline ({anomaly['expected_range']})",
+            'connection_anomaly': f"Connection count ({anomaly.get('current_value')}) outside normal range ({anomaly['expected_range']})",
+            'port_usage_anomaly': f"Port usage pattern ({anomaly.get('current_value')} unique ports) deviates from baseline",
             'ip_frequency_anomaly': f"IP {anomaly.get('ip_address', 'unknown')} showing unusual traffic frequency"
         }
         
@@ -273,7 +401,7 @@ class AnomalyDetector:
             'type': anomaly['severity'],
             'title': title_map.get(anomaly['type'], 'Network Anomaly Detected'),
             'description': description_map.get(anomaly['type'], 'Unusual network behavior detected'),
-            'timestamp': datetime.now().isoformat(),
+            'ts': time.time(),  # Epoch seconds; formatted to ISO only when served
             'source_ip': anomaly.get('ip_address', 'multiple'),
             'destination_ip': 'multiple',
             'status': 'active',
@@ -282,12 +410,12 @@ class AnomalyDetector:
     
     def get_status(self):
         """Get current anomaly detection status"""
+        cutoff = time.time() - 3600
         return {
             'baseline_established': self.baseline_established,
             'baseline_progress': min(100, ((time.time() - self.start_time) / self.baseline_period) * 100),
             'data_points_collected': len(self.packet_rates),
-            'recent_anomalies': len([a for a in self.alerts if 
-                                   datetime.fromisoformat(a['timestamp']) > datetime.now() - timedelta(hours=1)]),
+            'recent_anomalies': sum(1 for a in self.alerts if a['ts'] > cutoff),
             'current_metrics': {
                 'packet_rate': self.current_metrics['packet_rate'],
                 'connection_count': self.current_metrics['connection_count'],
@@ -319,13 +447,14 @@ def main():
     
     # Analyze normal traffic
     print("Analyzing normal traffic patterns...")
+    detector.record_traffic(sample_traffic)
     for _ in range(10):
-        anomalies = detector.analyze_traffic(sample_traffic)
+        anomalies = detector.analyze_traffic()
         time.sleep(0.1)
     
     # Add anomalous traffic
     print("Injecting anomalous traffic...")
-    anomalous_traffic = sample_traffic.copy()
+    anomalous_traffic = []
     
     # Add burst of traffic (DDoS-like)
     for i in range(200):
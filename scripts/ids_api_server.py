@@ -2,29 +2,51 @@
 """
 IDS API Server
 Provides REST API endpoints for the frontend to communicate with the Python backend
+
+Run with `python3 ids_api_server.py` (waitress, 8 request threads) or under gunicorn:
+    gunicorn -k gthread --workers 1 --threads 8 -b 0.0.0.0:5000 ids_api_server:app
+Keep a single worker process: monitoring state lives in this process's memory.
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, request
 from flask_cors import CORS
-import json
+import heapq
+import numpy as np
+import orjson
 import threading
 import time
 from datetime import datetime
-import ipaddress
-import socket
-import whois
-from network_monitor import NetworkMonitor
-from anomaly_detector import AnomalyDetector
+from itertools import islice
+from operator import itemgetter
+from network_monitor import HEADER_DTYPE, NetworkMonitor
+from anomaly_detector import AnomalyDetector, ip_to_int
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend communication
 
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+
+def json_response(obj):
+    """Serialize `obj` with orjson into an application/json response"""
+    return Response(orjson.dumps(obj, option=ORJSON_OPTIONS), mimetype='application/json')
+
 # Global instances
 network_monitor = NetworkMonitor()
 anomaly_detector = AnomalyDetector()
 monitoring_thread = None
 is_monitoring = False
 
+# Serializes start/stop; each worker runs until its own stop event is set
+monitoring_lock = threading.Lock()
+monitoring_stop = threading.Event()
+
+# Guards monitor/detector state shared between the worker and request threads
+state_lock = threading.Lock()
+
+# Last serialized /api/system-status payload as (created_at, json_bytes)
+STATUS_CACHE_TTL = 0.5  # seconds
+_last_status = (0.0, None)
+
 # Configuration storage
 ids_config = {
     'enablePortScanDetection': True,
@@ -46,86 +68,106 @@ ids_config = {
     'blockDuration': '60'
 }
 
-def monitoring_worker():
-    """Background worker for network monitoring"""
-    global is_monitoring
-    
+def monitoring_worker(stop):
+    """Background worker for network monitoring; runs until `stop` is set"""
     print("Starting network monitoring worker...")
     
     # Simulate network monitoring (in real implementation, this would use raw sockets)
-    while is_monitoring:
+    while not stop.is_set():
         try:
             # Generate mock traffic data for demonstration
-            mock_traffic = generate_mock_traffic()
+            timestamps, source_ips, dest_ports = generate_mock_traffic()
+            headers = build_mock_headers(source_ips, dest_ports)
             
-            # Analyze with network monitor
-            for packet in mock_traffic:
-                if is_monitoring:
-                    network_monitor.analyze_packet(packet)
+            with state_lock:
+                # Analyze with network monitor
+                network_monitor.analyze_headers(headers)
+                
+                # Analyze with anomaly detector
+                anomaly_detector.add_packets(timestamps, source_ips, dest_ports)
+                if ids_config['enableAnomalyDetection']:
+                    anomaly_detector.analyze_traffic()
             
-            # Analyze with anomaly detector
-            if ids_config['enableAnomalyDetection']:
-                anomaly_detector.analyze_traffic(mock_traffic)
-            
-            time.sleep(1)  # Monitor every second
+            stop.wait(1)  # Monitor every second
             
         except Exception as e:
             print(f"Error in monitoring worker: {e}")
-            time.sleep(5)
+            stop.wait(5)
     
     print("Network monitoring worker stopped")
 
+MOCK_LAN_BASE = ip_to_int('192.168.1.0')
+MOCK_SUSPICIOUS_IP = ip_to_int('203.0.113.45')
+MOCK_DEST_IP = ip_to_int('10.0.0.1')
+MOCK_SERVICE_PORTS = np.array([80, 443, 22, 25, 53], dtype=np.uint16)
+
+_rng = np.random.default_rng()
+
 def generate_mock_traffic():
-    """Generate mock network traffic for demonstration"""
-    import random
-    
-    mock_packets = []
+    """Generate mock network traffic for demonstration as parallel
+    (timestamps, source_ips, dest_ports) arrays, source IPs as uint32"""
     current_time = time.time()
     
     # Generate normal traffic
-    for _ in range(random.randint(10, 50)):
-        source_ip = f"192.168.1.{random.randint(10, 100)}"
-        dest_port = random.choice([80, 443, 22, 25, 53])
-        
-        packet_data = {
-            'timestamp': current_time,
-            'source_ip': source_ip,
-            'dest_ip': '10.0.0.1',
-            'dest_port': dest_port,
-            'protocol': 'TCP'
-        }
-        mock_packets.append(packet_data)
+    count = int(_rng.integers(10, 51))
+    source_ips = MOCK_LAN_BASE + _rng.integers(10, 101, size=count, dtype=np.uint32)
+    dest_ports = _rng.choice(MOCK_SERVICE_PORTS, size=count)
     
     # Occasionally generate suspicious traffic
-    if random.random() < 0.1:  # 10% chance
-        suspicious_ip = "203.0.113.45"
-        for _ in range(random.randint(20, 100)):
-            packet_data = {
-                'timestamp': current_time,
-                'source_ip': suspicious_ip,
-                'dest_ip': '10.0.0.1',
-                'dest_port': random.randint(1, 65535),
-                'protocol': 'TCP'
-            }
-            mock_packets.append(packet_data)
+    if _rng.random() < 0.1:  # 10% chance
+        burst = int(_rng.integers(20, 101))
+        source_ips = np.concatenate((source_ips, np.full(burst, MOCK_SUSPICIOUS_IP, dtype=np.uint32)))
+        dest_ports = np.concatenate((dest_ports, _rng.integers(1, 65536, size=burst, dtype=np.uint16)))
     
-    return mock_packets
+    return np.full(source_ips.size, current_time), source_ips, dest_ports
+
+def build_mock_headers(source_ips, dest_ports):
+    """Pack mock traffic into IPv4/TCP SYN header records for the network monitor"""
+    headers = np.zeros(source_ips.size, dtype=HEADER_DTYPE)
+    headers['ver_ihl'] = 0x45
+    headers['total_length'] = HEADER_DTYPE.itemsize
+    headers['ttl'] = 64
+    headers['protocol'] = 6  # TCP
+    headers['source_ip'] = source_ips
+    headers['dest_ip'] = MOCK_DEST_IP
+    headers['source_port'] = _rng.integers(49152, 65536, size=source_ips.size, dtype=np.uint16)
+    headers['dest_port'] = dest_ports
+    headers['offset'] = 5 << 4
+    headers['flags'] = 0x02  # SYN
+    headers['window'] = 65535
+    return headers
+
+def format_alert(alert):
+    """Copy of `alert` with its epoch 'ts' rendered as an ISO 'timestamp' for the API"""
+    return {**alert, 'timestamp': datetime.fromtimestamp(alert['ts']).isoformat()}
 
 @app.route('/api/system-status', methods=['GET'])
 def get_system_status():
     """Get current system status and alerts"""
+    global _last_status
+    
+    # Coalesce rapid dashboard polling onto one payload per TTL window
+    created_at, payload = _last_status
+    if payload is not None and time.time() - created_at < STATUS_CACHE_TTL:
+        return Response(payload, mimetype='application/json')
+    
     try:
-        # Get stats from network monitor
-        monitor_status = network_monitor.get_status_json()
-        
-        # Get anomaly detector status
-        anomaly_status = anomaly_detector.get_status()
-        
-        # Combine alerts from both systems
-        all_alerts = monitor_status['alerts'] + anomaly_detector.alerts[-5:]
-        
-        # Sort alerts by timestamp (most recent first)
-        all_alerts.sort(key=lambda x: x['timestamp'], reverse=True)
+        with state_lock:
+            # Get stats from network monitor
+            monitor_status = network_monitor.get_status_json()
+            
+            # Get anomaly detector status
+            anomaly_status = anomaly_detector.get_status()
+            
+            # Combine alerts from both systems; each source is already in chronological
+            # order, so merge them newest-first instead of sorting the combined list.
+            # The monitor's alerts arrive formatted; format the anomaly alerts to match
+            all_alerts = list(islice(heapq.merge(
+                reversed(monitor_status['alerts']),
+                map(format_alert, islice(reversed(anomaly_detector.alerts), 5)),
+                key=itemgetter('ts'),
+                reverse=True
+            ), 10))
         
         response = {
             'stats': {
@@ -136,37 +178,48 @@ def get_system_status():
                 'system_uptime': monitor_status['stats']['system_uptime'],
                 'last_scan': monitor_status['stats']['last_scan']
             },
-            'alerts': all_alerts[:10],  # Return top 10 most recent alerts
+            'alerts': all_alerts,  # Return top 10 most recent alerts
             'monitoring_status': is_monitoring,
             'anomaly_detection': anomaly_status,
             'blocked_ips': monitor_status['blocked_ips'],
             'whitelisted_ips': monitor_status['whitelisted_ips']
         }
         
-        return jsonify(response)
+        payload = orjson.dumps(response, option=ORJSON_OPTIONS)
+        _last_status = (time.time(), payload)
+        return Response(payload, mimetype='application/json')
         
     except Exception as e:
         print(f"Error getting system status: {e}")
-        return jsonify({'error': 'Failed to get system status'}), 500
+        return json_response({'error': 'Failed to get system status'}), 500
 
 @app.route('/api/monitoring/start', methods=['POST'])
 def start_monitoring():
     """Start network monitoring"""
-    global monitoring_thread, is_monitoring
+    global monitoring_thread, monitoring_stop, is_monitoring, _last_status
     
     try:
-        if not is_monitoring:
-            is_monitoring = True
-            monitoring_thread = threading.Thread(target=monitoring_worker, daemon=True)
-            monitoring_thread.start()
-            
-            return jsonify({
+        with monitoring_lock:
+            started = not is_monitoring
+            if started:
+                # A worker stopped just before this may still be finishing its pass
+                if monitoring_thread is not None:
+                    monitoring_thread.join()
+                is_monitoring = True
+                _last_status = (0.0, None)
+                monitoring_stop = threading.Event()
+                monitoring_thread = threading.Thread(target=monitoring_worker, args=(monitoring_stop,),
+                                                     daemon=True)
+                monitoring_thread.start()
+        
+        if started:
+            return json_response({
                 'success': True,
                 'message': 'Network monitoring started',
                 'status': 'active'
             })
         else:
-            return jsonify({
+            return json_response({
                 'success': True,
                 'message': 'Network monitoring already active',
                 'status': 'active'
@@ -174,17 +227,20 @@ def start_monitoring():
             
     except Exception as e:
         print(f"Error starting monitoring: {e}")
-        return jsonify({'error': 'Failed to start monitoring'}), 500
+        return json_response({'error': 'Failed to start monitoring'}), 500
 
 @app.route('/api/monitoring/stop', methods=['POST'])
 def stop_monitoring():
     """Stop network monitoring"""
-    global is_monitoring
+    global is_monitoring, _last_status
     
     try:
-        is_monitoring = False
+        with monitoring_lock:
+            is_monitoring = False
+            monitoring_stop.set()
+            _last_status = (0.0, None)
         
-        return jsonify({
+        return json_response({
             'success': True,
             'message': 'Network monitoring stopped',
             'status': 'inactive'
@@ -192,7 +248,7 @@ def stop_monitoring():
         
     except Exception as e:
         print(f"Error stopping monitoring: {e}")
-        return jsonify({'error': 'Failed to stop monitoring'}), 500
+        return json_response({'error': 'Failed to stop monitoring'}), 500
 
 @app.route('/api/config', methods=['GET', 'POST'])
 def handle_config():
@@ -200,7 +256,7 @@ def handle_config():
     global ids_config
     
     if request.method == 'GET':
-        return jsonify(ids_config)
+        return json_response(ids_config)
     
     elif request.method == 'POST':
         try:
@@ -212,38 +268,43 @@ def handle_config():
             # Apply configuration to monitoring systems
             apply_configuration(ids_config)
             
-            return jsonify({
+            return json_response({
                 'success': True,
                 'message': 'Configuration updated successfully'
             })
             
         except Exception as e:
             print(f"Error updating configuration: {e}")
-            return jsonify({'error': 'Failed to update configuration'}), 500
+            return json_response({'error': 'Failed to update configuration'}), 500
+
+# Per sensitivity level: (packet_rate, connection, ip_frequency) std multipliers,
+# then the port scan and DDoS thresholds
+SENSITIVITY_LEVELS = {
+    'high': (2, 2, 1.5, 5, 50),
+    'medium': (3, 2.5, 2, 10, 100),
+    'low': (4, 3, 2.5, 20, 200)
+}
 
 def apply_configuration(config):
     """Apply configuration to monitoring systems"""
     try:
+        packet_rate, connection, ip_frequency, port_scan, ddos = SENSITIVITY_LEVELS.get(
+            config['sensitivityLevel'], SENSITIVITY_LEVELS['medium'])
+        
         # Update network monitor configuration
         network_monitor.config.update({
-            'port_scan_threshold': 5 if config['sensitivityLevel'] == 'high' else 10 if config['sensitivityLevel'] == 'medium' else 20,
-            'ddos_threshold': 50 if config['sensitivityLevel'] == 'high' else 100 if config['sensitivityLevel'] == 'medium' else 200,
+            'port_scan_threshold': port_scan,
+            'ddos_threshold': ddos,
             'auto_block': config['autoBlockEnabled']
         })
         
         # Update anomaly detector thresholds
-        sensitivity_multipliers = {
-            'high': {'packet_rate': 2, 'connection': 2, 'ip_frequency': 1.5},
-            'medium': {'packet_rate': 3, 'connection': 2.5, 'ip_frequency': 2},
-            'low': {'packet_rate': 4, 'connection': 3, 'ip_frequency': 2.5}
-        }
-        
-        multipliers = sensitivity_multipliers.get(config['sensitivityLevel'], sensitivity_multipliers['medium'])
-        anomaly_detector.thresholds.update({
-            'packet_rate_std_multiplier': multipliers['packet_rate'],
-            'connection_count_std_multiplier': multipliers['connection'],
-            'ip_frequency_std_multiplier': multipliers['ip_frequency']
-        })
+        with state_lock:
+            anomaly_detector.update_thresholds({
+                'packet_rate_std_multiplier': packet_rate,
+                'connection_count_std_multiplier': connection,
+                'ip_frequency_std_multiplier': ip_frequency
+            })
         
         print(f"Configuration applied: sensitivity={config['sensitivityLevel']}")
         
@@ -257,22 +318,27 @@ def update_alert_status(alert_id):
         data = request.get_json()
         new_status = data.get('status')
         
-        # Update alert in network monitor
-        for alert in network_monitor.alerts:
-            if alert['id'] == alert_id:
-                alert['status'] = new_status
-                break
-        
-        # Update alert in anomaly detector
-        for alert in anomaly_detector.alerts:
-            if alert['id'] == alert_id:
-                alert['status'] = new_status
-                break
+        with state_lock:
+            # Look the alert up in the network monitor, then the anomaly detector
+            alert = network_monitor.get_alert(alert_id)
+            if alert:
+                network_monitor.set_alert_status(alert, new_status)
+            else:
+                alert = anomaly_detector.get_alert(alert_id)
+                if alert:
+                    alert['status'] = new_status
         
-        return jsonify({
+        return json_response({
             'success': True,
             'message': f'Alert {alert_id} status updated to {new_status}'
         })
         
     except Exception as e:
-        print(f"Error
+        print(f"Error updating alert status: {e}")
+        return json_response({'error': 'Failed to update alert status'}), 500
+
+if __name__ == '__main__':
+    from waitress import serve
+    
+    print("Starting IDS API server on http://0.0.0.0:5000")
+    serve(app, host='0.0.0.0', port=5000, threads=8)
@@ -4,136 +4,579 @@ Network Traffic Monitor for Intrusion Detection System
 Monitors network packets and detects suspicious activities
 """
 
+import ctypes
+import errno
+import mmap
+import numpy as np
+import os
+import re
+import select
 import socket
 import struct
 import time
-import json
 import threading
 from datetime import datetime
-from collections import defaultdict, deque
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from typing import NamedTuple
 import ipaddress
+from anomaly_detector import int_to_ip
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; the kernels below also run as plain NumPy
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+try:
+    import hyperscan
+except ImportError:  # Hyperscan is optional; signatures then run through the re module
+    hyperscan = None
+
+try:
+    # Prebuilt only (cythonize -i network_monitor_core.pyx); never compiled at import time
+    from network_monitor_core import Capture
+except ImportError:  # The compiled loop is optional; capture then stays in Python
+    Capture = None
+
+# Precompiled header layouts (IPv4 without options, TCP without options)
+_IP_HDR = struct.Struct('!BBHHHBBHII')  # addresses as uint32 keys
+_TCP_HDR = struct.Struct('!HHLLBBHHH')
+
+class IpInfo(NamedTuple):
+    version: int
+    header_length: int
+    ttl: int
+    protocol: int
+    source_ip: int       # uint32 key
+    destination_ip: int  # uint32 key
+
+class TcpInfo(NamedTuple):
+    source_port: int
+    destination_port: int
+    sequence: int
+    acknowledgement: int
+    header_length: int
+    flags: int
+
+# Build parser results straight from a tuple; the generated NamedTuple __new__ runs
+# as Python code and costs more than the dict it replaces
+_tuple_new = tuple.__new__
+
+# Same 20-byte IPv4 + 20-byte TCP layout as a NumPy record, for batch overlays
+HEADER_DTYPE = np.dtype([
+    ('ver_ihl', 'u1'), ('tos', 'u1'), ('total_length', '>u2'), ('ident', '>u2'),
+    ('frag', '>u2'), ('ttl', 'u1'), ('protocol', 'u1'), ('checksum', '>u2'),
+    ('source_ip', '>u4'), ('dest_ip', '>u4'),
+    ('source_port', '>u2'), ('dest_port', '>u2'), ('sequence', '>u4'), ('ack', '>u4'),
+    ('offset', 'u1'), ('flags', 'u1'), ('window', '>u2'), ('tcp_checksum', '>u2'), ('urgent', '>u2')
+])
+
+# Recent TCP packets are logged column-wise in rings of this many entries
+HISTORY_SIZE = 1000
+
+# Per-IP packet timestamps live in a float64 ring; old slots are simply overwritten.
+# All per-IP detection state runs on time.monotonic() so wall-clock steps (NTP,
+# settimeofday) cannot unsort the rings or stretch windows; alerts keep time.time().
+# Rings hold at least RING_SIZE and at least twice the DDoS threshold.
+RING_SIZE = 128
+
+# Rings of sources silent for IDLE_TIMEOUT seconds (and expired port-scan windows) are
+# dropped, checked every IDLE_SWEEP_INTERVAL
+IDLE_TIMEOUT = 60.0
+IDLE_SWEEP_INTERVAL = 10.0
+
+@njit(cache=True)
+def push_ts(buf, head, t):
+    """Store timestamp `t` in ring `buf` and return the advanced head"""
+    buf[head % buf.size] = t
+    return head + 1
+
+@njit(cache=True)
+def count_recent(buf, head, now, window):
+    """Number of timestamps in ring `buf` newer than `window` seconds before `now`.
+    
+    Per-IP timestamps come from time.monotonic() and never decrease, so the ring
+    is two sorted runs split at the head and each can be binary searched."""
+    cutoff = now - window
+    if head <= buf.size:
+        return head - np.searchsorted(buf[:head], cutoff, side='right')
+    split = head % buf.size
+    return (buf.size - np.searchsorted(buf[split:], cutoff, side='right')
+            - np.searchsorted(buf[:split], cutoff, side='right'))
+
+@njit(cache=True)
+def detect(buf, head, now, threshold):
+    """True if more than `threshold` of the `head` pushed timestamps fall in the last second"""
+    return head > threshold and count_recent(buf, head, now, 1.0) > threshold
+
+def _fmt_ts(ts):
+    """Render an epoch timestamp as ISO 8601; stored records keep raw floats"""
+    return datetime.fromtimestamp(ts).isoformat()
+
+# Addresses are tracked as uint32 keys and only formatted for alerts and the API
+_ip_str = lru_cache(maxsize=4096)(int_to_ip)
+
+def _parse_ip(ip):
+    """Strictly parse a dotted-quad IPv4 address given by a caller to its uint32 key.
+    Returns None if invalid (anomaly_detector.ip_to_int would map it to 0.0.0.0)"""
+    try:
+        return int(ipaddress.IPv4Address(ip))
+    except ValueError:
+        return None
+
+# Payload signatures: (pattern, alert title, severity)
+SIGNATURES = [
+    (rb'/etc/(?:passwd|shadow)', 'Sensitive File Access', 'high'),
+    (rb'(?i:union\s+(?:all\s+)?select)', 'SQL Injection Attempt', 'high'),
+    (rb'(?i:<script[\s>])', 'Cross-Site Scripting Attempt', 'medium'),
+    (rb'\.\./\.\./', 'Directory Traversal Attempt', 'medium'),
+    (rb'\x90{32}', 'NOP Sled Detected', 'high'),
+    (rb'(?i:cmd\.exe|/bin/sh)', 'Shell Command Injection', 'high'),
+]
+
+class SignatureScanner:
+    """Match packet payloads against all signatures in one pass.
+    
+    With Hyperscan installed the patterns are compiled into a single
+    block-mode database; otherwise each is searched with the re module.
+    scan() returns the indexes of matching signatures in order.
+    
+    Hyperscan scratch space is per scanner, so a scanner must only be used
+    by one thread at a time; copy() gives each thread its own.
+    """
+    
+    def __init__(self, signatures=SIGNATURES):
+        self.signatures = signatures
+        patterns = [pattern for pattern, _, _ in signatures]
+        if hyperscan is not None:
+            self._db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+            self._db.compile(expressions=patterns, ids=list(range(len(patterns))),
+                             flags=hyperscan.HS_FLAG_SINGLEMATCH)
+            self._scratch = hyperscan.Scratch(self._db)
+            self._regexes = None
+        else:
+            self._db = None
+            self._scratch = None
+            self._regexes = [re.compile(pattern) for pattern in patterns]
+    
+    def copy(self):
+        """Scanner sharing the compiled patterns but with its own scratch space"""
+        scanner = object.__new__(SignatureScanner)
+        scanner.signatures = self.signatures
+        scanner._db = self._db
+        scanner._scratch = hyperscan.Scratch(self._db) if self._db is not None else None
+        scanner._regexes = self._regexes
+        return scanner
+    
+    def scan(self, payload):
+        if self._db is not None:
+            matches = []
+            self._db.scan(bytes(payload), match_event_handler=lambda sig, start, end, flags, context:
+                          matches.append(sig), scratch=self._scratch)
+            return sorted(matches)
+        return [sig for sig, regex in enumerate(self._regexes) if regex.search(payload)]
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_IOVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+MSG_WAITFORONE = 0x10000
+
+def set_receive_timeout(sock, timeout):
+    """Make blocking receives on `sock` fail with EAGAIN after `timeout` ms (SO_RCVTIMEO),
+    leaving the socket itself in blocking mode"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO,
+                    struct.pack('ll', timeout // 1000, timeout % 1000 * 1000))
+
+class MmsgReceiver:
+    """Receive up to `batch` packets per syscall with Linux recvmmsg(2).
+    
+    Calling the receiver blocks for the first packet, then returns it and
+    any others already queued as memoryviews into a reused buffer, so each
+    one must be consumed before the next call (or returns [] after `timeout`
+    ms without traffic). Packets are truncated to `snaplen` bytes, which is
+    plenty for the headers analyzed here.
+    """
+    
+    def __init__(self, sock, batch=64, snaplen=2048, timeout=1000):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._recvmmsg = libc.recvmmsg  # AttributeError where recvmmsg is unavailable
+        self._recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint,
+                                   ctypes.c_int, ctypes.c_void_p]
+        set_receive_timeout(sock, timeout)
+        self._fd = sock.fileno()
+        self._batch = batch
+        self._snaplen = snaplen
+        self._buffer = bytearray(batch * snaplen)
+        self._view = memoryview(self._buffer)
+        
+        base = ctypes.addressof(ctypes.c_char.from_buffer(self._buffer))
+        self._iovecs = (_IOVec * batch)()
+        self._msgs = (_MMsgHdr * batch)()
+        for i in range(batch):
+            self._iovecs[i].iov_base = base + i * snaplen
+            self._iovecs[i].iov_len = snaplen
+            self._msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            self._msgs[i].msg_hdr.msg_iovlen = 1
+    
+    def __call__(self):
+        received = self._recvmmsg(self._fd, self._msgs, self._batch, MSG_WAITFORONE, None)
+        if received < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EINTR, errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise OSError(err, os.strerror(err))
+        
+        view, snaplen, msgs = self._view, self._snaplen, self._msgs
+        return [view[i * snaplen:i * snaplen + min(msgs[i].msg_len, snaplen)] for i in range(received)]
+
+# PACKET_MMAP receive ring (linux/if_packet.h)
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+_TPACKET_REQ3 = struct.Struct('IIIIIII')  # block_size, block_nr, frame_size, frame_nr, retire_tov, priv, features
+_BLOCK_STATUS = struct.Struct('I')        # tpacket_block_desc.hdr.bh1.block_status, at offset 8
+_BLOCK_PKTS = struct.Struct('II')         # num_pkts, offset_to_first_pkt, at offset 12
+_TPACKET3_HDR = struct.Struct('I8xI8xH')  # tp_next_offset, tp_snaplen, tp_mac
+
+class TPacketV3Ring:
+    """Read packets straight out of a TPACKET_V3 PACKET_RX_RING mapped from `sock`.
+    
+    The kernel fills whole blocks; each call hands back the Ethernet frames
+    of the next ready block as memoryviews into the ring (or [] after
+    `timeout` ms without traffic). The block is returned to the kernel on
+    the following call, so frames must be consumed before calling again.
+    """
+    
+    def __init__(self, sock, block_size=1 << 22, block_nr=8, frame_size=2048, timeout=1000):
+        sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        frame_nr = block_size * block_nr // frame_size
+        # Retire partly filled blocks after 60 ms so quiet links are not delayed
+        sock.setsockopt(SOL_PACKET, PACKET_RX_RING,
+                        _TPACKET_REQ3.pack(block_size, block_nr, frame_size, frame_nr, 60, 0, 0))
+        self._ring = mmap.mmap(sock.fileno(), block_size * block_nr,
+                               mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self._view = memoryview(self._ring)
+        self._block_size = block_size
+        self._block_nr = block_nr
+        self._block = 0
+        self._held = None
+        self._timeout = timeout
+        self._poller = select.poll()
+        self._poller.register(sock.fileno(), select.POLLIN | select.POLLERR)
+    
+    def __call__(self):
+        ring = self._ring
+        if self._held is not None:
+            _BLOCK_STATUS.pack_into(ring, self._held + 8, TP_STATUS_KERNEL)
+            self._held = None
+        
+        block = self._block * self._block_size
+        if not _BLOCK_STATUS.unpack_from(ring, block + 8)[0] & TP_STATUS_USER:
+            self._poller.poll(self._timeout)
+            if not _BLOCK_STATUS.unpack_from(ring, block + 8)[0] & TP_STATUS_USER:
+                return []
+        
+        # Walk the block's tpacket3_hdr chain
+        num_pkts, offset = _BLOCK_PKTS.unpack_from(ring, block + 12)
+        view, unpack_from = self._view, _TPACKET3_HDR.unpack_from
+        frames = []
+        position = block + offset
+        for _ in range(num_pkts):
+            next_offset, snaplen, mac = unpack_from(ring, position)
+            frames.append(view[position + mac:position + mac + snaplen])
+            position += next_offset
+        
+        self._held = block
+        self._block = (self._block + 1) % self._block_nr
+        return frames
+
+# Capture fan-out (linux/if_packet.h): PACKET_FANOUT_CBPF lets a BPF program pick the socket
+PACKET_FANOUT = 18
+PACKET_FANOUT_CBPF = 6
+PACKET_FANOUT_DATA = 22
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [('code', ctypes.c_uint16), ('jt', ctypes.c_uint8), ('jf', ctypes.c_uint8),
+                ('k', ctypes.c_uint32)]
+
+# ld [SKF_NET_OFF + 12] (IPv4 source address, relative to the network header since
+# fan-out runs before the link header is restored on receive); ret a.
+# The kernel takes the result modulo the group size, matching NetworkMonitor._shard().
+SKF_NET_OFF = -0x100000
+_FANOUT_BY_SOURCE = ((0x20, 0, 0, (SKF_NET_OFF + 12) & 0xFFFFFFFF), (0x16, 0, 0, 0))
+
+def join_fanout(sock, group_id):
+    """Add `sock` to a fan-out group that spreads packets by IPv4 source address"""
+    sock.setsockopt(SOL_PACKET, PACKET_FANOUT, group_id | PACKET_FANOUT_CBPF << 16)
+    program = (_SockFilter * len(_FANOUT_BY_SOURCE))(*_FANOUT_BY_SOURCE)
+    fprog = struct.pack('HP', len(_FANOUT_BY_SOURCE), ctypes.addressof(program))
+    sock.setsockopt(SOL_PACKET, PACKET_FANOUT_DATA, fprog)
+
+# Per-IP state bits in NetworkMonitor._ip_flags, so the packet path needs one lookup
+IP_BLOCKED = 1
+IP_WHITELISTED = 2
+IP_INVESTIGATED = 4
+
+# Socket options for steering and polling (asm-generic/socket.h)
+SO_BUSY_POLL = 46
+SO_INCOMING_CPU = 49
+
+def _first_cpu(cpu_list):
+    """First CPU of a kernel cpu list such as '2-5,8'"""
+    first = cpu_list.strip().split(',')[0].split('-')[0]
+    return int(first) if first.isdigit() else None
+
+def _mask_cpu(mask):
+    """Lowest CPU set in a hex cpumask such as '00000000,00000004'"""
+    value = int(mask.strip().replace(',', '') or '0', 16)
+    return (value & -value).bit_length() - 1 if value else None
+
+def rx_queue_cpus(interface):
+    """CPU servicing each RX queue of `interface` (None where unknown).
+    
+    Uses the affinity of the queue's IRQ from /proc/interrupts, falling back
+    to the queue's RPS mask."""
+    try:
+        queues = sorted(int(name[3:]) for name in os.listdir(f'/sys/class/net/{interface}/queues')
+                        if name.startswith('rx-'))
+    except OSError:
+        return []
+    
+    irqs = {}
+    try:
+        with open('/proc/interrupts') as f:
+            for line in f:
+                fields = line.split()
+                if fields and fields[0].rstrip(':').isdigit() and fields[-1].startswith(interface + '-'):
+                    irqs[fields[-1]] = fields[0].rstrip(':')
+    except OSError:
+        pass
+    
+    cpus = []
+    for queue in queues:
+        cpu = None
+        # Drivers name queue vectors e.g. eth0-rx-0, eth0-TxRx-0 or eth0-0; skip TX-only ones
+        irq = next((irq for name, irq in irqs.items()
+                    if name.endswith(f'-{queue}') and not name.lower().endswith(f'-tx-{queue}')), None)
+        if irq is not None:
+            try:
+                with open(f'/proc/irq/{irq}/smp_affinity_list') as f:
+                    cpu = _first_cpu(f.read())
+            except OSError:
+                pass
+        if cpu is None:
+            try:
+                with open(f'/sys/class/net/{interface}/queues/rx-{queue}/rps_cpus') as f:
+                    cpu = _mask_cpu(f.read())
+            except OSError:
+                pass
+        cpus.append(cpu)
+    return cpus
+
+def pin_capture(sock, cpu, busy_poll_us=50):
+    """Best effort: run the calling thread on `cpu` (one that services an RX queue),
+    and tune `sock` for that CPU and for NAPI busy polling"""
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+            sock.setsockopt(socket.SOL_SOCKET, SO_INCOMING_CPU, cpu)
+        except OSError:
+            pass
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_BUSY_POLL, busy_poll_us)
+    except OSError:  # Raising the busy-poll budget needs CAP_NET_ADMIN
+        pass
 
 class NetworkMonitor:
-    def __init__(self):
+    def __init__(self, workers=1):
+        # Counters and the traffic history ring below are shared by every capture
+        # worker without a lock. With workers > 1 concurrent updates can be lost (the
+        # counts may run slightly low and a history slot may be written twice while
+        # another is skipped); they are statistics only, detection uses the shards
         self.packet_count = 0
         self.suspicious_packets = 0
-        self.connection_tracker = defaultdict(list)
-        self.port_scan_tracker = defaultdict(set)
-        self.traffic_history = deque(maxlen=1000)
-        self.blocked_ips = set()
+        
+        # Per-IP detection state is split into one shard per capture worker. Packets are
+        # fanned out by source address, so each shard is only ever touched by its own
+        # worker and needs no lock:
+        #   'conn':  ip -> (timestamp ring, number of timestamps pushed)
+        #   'ports': ip -> [low-port bitmap, high-port set, distinct ports, window start]
+        #   'next_sweep': when (monotonic) the owning worker next evicts idle 'conn' and 'ports' entries
+        #   'scanner': the worker's own SignatureScanner (Hyperscan scratch is per thread)
+        self.workers = workers
+        self.signature_scanner = SignatureScanner()
+        self._shards = [{'conn': {}, 'ports': {}, 'next_sweep': 0.0,
+                         'scanner': self.signature_scanner.copy()} for _ in range(workers)]
+        # Traffic history as columnar rings; get_traffic_history() rebuilds entries on read
+        self._hist_ts = np.zeros(HISTORY_SIZE)
+        self._hist_src = np.zeros(HISTORY_SIZE, dtype=np.uint32)
+        self._hist_dst = np.zeros(HISTORY_SIZE, dtype=np.uint32)
+        self._hist_dport = np.zeros(HISTORY_SIZE, dtype=np.uint16)
+        self._hist_flags = np.zeros(HISTORY_SIZE, dtype=np.uint8)
+        self._hist_head = 0
+        self.blocked_ips = set()  # uint32 keys, like every per-IP table here
         self.whitelisted_ips = set()  # New: Track whitelisted IPs
-        self.alerts = []
+        self.alerts = deque(maxlen=1000)  # Oldest alerts are evicted (and unindexed) first
+        self._alerts_by_id = {}
+        self._active_alerts = 0
+        self._alert_lock = threading.Lock()  # Alerts are shared by all workers (rare path)
         self.ip_investigation_data = {}  # New: Store investigation data for IPs
+        self._ip_flags = {}  # ip -> IP_* bits mirroring the three tables above
         
         # Configuration
         self.config = {
             'port_scan_threshold': 10,  # Number of different ports to trigger alert
             'ddos_threshold': 100,      # Packets per second to trigger DDoS alert
+            'port_scan_window': 60,     # Seconds before an IP's port history is reset
+            'pin_capture': True,        # Pin capture workers to the RX queues' CPUs
             'monitoring_enabled': True,
             'auto_block': False
         }
         
     def parse_ip_header(self, packet):
-        """Parse IP header from raw packet"""
-        try:
-            # Unpack the first 20 bytes of IP header
-            ip_header = packet[0:20]
-            iph = struct.unpack('!BBHHHBBH4s4s', ip_header)
-            
-            version_ihl = iph[0]
-            version = version_ihl >> 4
-            ihl = version_ihl & 0xF
-            
-            iph_length = ihl * 4
-            ttl = iph[5]
-            protocol = iph[6]
-            s_addr = socket.inet_ntoa(iph[8])
-            d_addr = socket.inet_ntoa(iph[9])
-            
-            return {
-                'version': version,
-                'header_length': iph_length,
-                'ttl': ttl,
-                'protocol': protocol,
-                'source_ip': s_addr,
-                'destination_ip': d_addr
-            }
-        except Exception as e:
-            print(f"Error parsing IP header: {e}")
+        """Parse IP header from raw packet into an IpInfo (None if too short)"""
+        if len(packet) < _IP_HDR.size:
             return None
+        
+        # Unpack the first 20 bytes of IP header
+        version_ihl, _, _, _, _, ttl, protocol, _, s_addr, d_addr = _IP_HDR.unpack_from(packet)
+        return _tuple_new(IpInfo, (version_ihl >> 4, (version_ihl & 0xF) * 4, ttl, protocol, s_addr, d_addr))
     
     def parse_tcp_header(self, packet, ip_header_length):
-        """Parse TCP header from packet"""
-        try:
-            tcp_header = packet[ip_header_length:ip_header_length+20]
-            tcph = struct.unpack('!HHLLBBHHH', tcp_header)
-            
-            source_port = tcph[0]
-            dest_port = tcph[1]
-            sequence = tcph[2]
-            acknowledgement = tcph[3]
-            doff_reserved = tcph[4]
-            tcph_length = (doff_reserved >> 4) * 4
-            flags = tcph[5]
-            
-            return {
-                'source_port': source_port,
-                'destination_port': dest_port,
-                'sequence': sequence,
-                'acknowledgement': acknowledgement,
-                'header_length': tcph_length,
-                'flags': flags
-            }
-        except Exception as e:
-            print(f"Error parsing TCP header: {e}")
+        """Parse TCP header from packet into a TcpInfo (None if too short)"""
+        if len(packet) < ip_header_length + _TCP_HDR.size:
             return None
+        
+        source_port, dest_port, sequence, acknowledgement, doff_reserved, flags, _, _, _ = \
+            _TCP_HDR.unpack_from(packet, ip_header_length)
+        return _tuple_new(TcpInfo, (source_port, dest_port, sequence, acknowledgement,
+                                    (doff_reserved >> 4) * 4, flags))
+    
+    def _record_alert(self, alert):
+        """Append an alert, keeping the id index and active count in step with deque eviction"""
+        with self._alert_lock:
+            if len(self.alerts) == self.alerts.maxlen:
+                evicted = self.alerts[0]
+                if evicted['status'] == 'active':
+                    self._active_alerts -= 1
+                if self._alerts_by_id.get(evicted['id']) is evicted:
+                    del self._alerts_by_id[evicted['id']]
+            self.alerts.append(alert)
+            self._alerts_by_id[alert['id']] = alert
+            if alert['status'] == 'active':
+                self._active_alerts += 1
+    
+    def get_alert(self, alert_id):
+        """Look up a retained alert by id (None if unknown or evicted)"""
+        return self._alerts_by_id.get(alert_id)
+    
+    def set_alert_status(self, alert, status):
+        """Change a retained alert's status, keeping the active count current"""
+        with self._alert_lock:
+            self._active_alerts += (status == 'active') - (alert['status'] == 'active')
+            alert['status'] = status
+    
+    def resolve_alert(self, alert):
+        """Mark a retained alert as resolved"""
+        self.set_alert_status(alert, 'resolved')
+    
+    def _shard(self, source_ip):
+        """Per-IP state shard owning `source_ip` (same split as the capture fan-out)"""
+        return self._shards[source_ip % self.workers]
+    
+    def _tracked_ips(self):
+        """Number of source IPs tracked across all shards"""
+        return sum(len(shard['conn']) for shard in self._shards)
+    
+    def _track_port(self, source_ip, dest_port, now):
+        """Record `dest_port` for `source_ip` at monotonic time `now` and return its distinct-port count"""
+        ports = self._shard(source_ip)['ports']
+        entry = ports.get(source_ip)
+        if entry is None or now - entry[3] >= self.config['port_scan_window']:
+            entry = ports[source_ip] = [0, set(), 0, now]
+        
+        if dest_port < 1024:
+            # Well-known ports are bits in one integer; only new bits bump the count
+            bit = 1 << dest_port
+            if not entry[0] & bit:
+                entry[0] |= bit
+                entry[2] += 1
+        elif dest_port not in entry[1]:
+            entry[1].add(dest_port)
+            entry[2] += 1
+        return entry[2]
+    
+    def _ports_seen(self, source_ip):
+        """Ports recorded for `source_ip` in its current port-scan window"""
+        entry = self._shard(source_ip)['ports'].get(source_ip)
+        if entry is None:
+            return []
+        bits = entry[0]
+        return [port for port in range(bits.bit_length()) if bits >> port & 1] + sorted(entry[1])
     
     def detect_port_scan(self, source_ip, dest_port):
         """Detect potential port scanning activity"""
         # Skip detection for whitelisted IPs
-        if source_ip in self.whitelisted_ips:
+        if self._ip_flags.get(source_ip, 0) & IP_WHITELISTED:
             return False
             
         current_time = time.time()
         
         # Track ports accessed by this IP
-        self.port_scan_tracker[source_ip].add(dest_port)
+        ports_seen = self._track_port(source_ip, dest_port, time.monotonic())
         
         # Check if this IP has accessed too many different ports
-        if len(self.port_scan_tracker[source_ip]) > self.config['port_scan_threshold']:
+        if ports_seen > self.config['port_scan_threshold']:
             alert = {
                 'id': f"ps_{int(current_time)}",
                 'type': 'high',
                 'title': 'Port Scan Detected',
-                'description': f'IP {source_ip} has accessed {len(self.port_scan_tracker[source_ip])} different ports',
-                'timestamp': datetime.now().isoformat(),
-                'source_ip': source_ip,
+                'description': f'IP {_ip_str(source_ip)} has accessed {ports_seen} different ports',
+                'ts': current_time,
+                'source_ip': _ip_str(source_ip),
                 'destination_ip': 'multiple',
                 'status': 'active'
             }
-            self.alerts.append(alert)
+            self._record_alert(alert)
             self.suspicious_packets += 1
             
             # Track investigation data
-            if source_ip not in self.ip_investigation_data:
+            if not self._ip_flags.get(source_ip, 0) & IP_INVESTIGATED:
+                self._flag_ip(source_ip, IP_INVESTIGATED)
                 self.ip_investigation_data[source_ip] = {
-                    'first_seen': datetime.now().isoformat(),
+                    'first_seen': current_time,
                     'activities': [],
-                    'ports_accessed': list(self.port_scan_tracker[source_ip]),
+                    'ports_accessed': set(self._ports_seen(source_ip)),
                     'classification': 'unknown',
                     'notes': ''
                 }
             
             self.ip_investigation_data[source_ip]['activities'].append({
-                'timestamp': datetime.now().isoformat(),
+                'ts': current_time,
                 'action': 'Port Scan Detected',
-                'details': f'Accessed {len(self.port_scan_tracker[source_ip])} different ports',
+                'details': f'Accessed {ports_seen} different ports',
                 'severity': 'high'
             })
             
-            if self.config['auto_block'] and source_ip not in self.whitelisted_ips:
+            if self.config['auto_block'] and not self._ip_flags.get(source_ip, 0) & IP_WHITELISTED:
                 self.blocked_ips.add(source_ip)
-                print(f"Auto-blocked IP: {source_ip}")
+                self._flag_ip(source_ip, IP_BLOCKED)
+                print(f"Auto-blocked IP: {_ip_str(source_ip)}")
             
             return True
         return False
@@ -141,128 +584,284 @@ class NetworkMonitor:
     def detect_ddos(self, source_ip):
         """Detect potential DDoS attacks"""
         # Skip detection for whitelisted IPs
-        if source_ip in self.whitelisted_ips:
+        if self._ip_flags.get(source_ip, 0) & IP_WHITELISTED:
             return False
             
         current_time = time.time()
+        now = time.monotonic()
+        
+        buf, head = self._shard(source_ip)['conn'].get(source_ip, (None, 0))
+        if buf is None or not detect(buf, head, now, self.config['ddos_threshold']):
+            return False
         
         # Count packets from this IP in the last second
-        recent_packets = [t for t in self.connection_tracker[source_ip] 
-                         if current_time - t < 1.0]
+        recent_packets = count_recent(buf, head, now, 1.0)
+        
+        alert = {
+            'id': f"ddos_{int(current_time)}",
+            'type': 'high',
+            'title': 'DDoS Attack Detected',
+            'description': f'IP {_ip_str(source_ip)} sent {recent_packets} packets in 1 second',
+            'ts': current_time,
+            'source_ip': _ip_str(source_ip),
+            'destination_ip': 'multiple',
+            'status': 'active'
+        }
+        self._record_alert(alert)
+        self.suspicious_packets += 1
+        
+        # Track investigation data
+        if not self._ip_flags.get(source_ip, 0) & IP_INVESTIGATED:
+            self._flag_ip(source_ip, IP_INVESTIGATED)
+            self.ip_investigation_data[source_ip] = {
+                'first_seen': current_time,
+                'activities': [],
+                'ports_accessed': set(),
+                'classification': 'unknown',
+                'notes': ''
+            }
+        
+        self.ip_investigation_data[source_ip]['activities'].append({
+            'ts': current_time,
+            'action': 'DDoS Attack Detected',
+            'details': f'Sent {recent_packets} packets in 1 second',
+            'severity': 'high'
+        })
         
-        if len(recent_packets) > self.config['ddos_threshold']:
+        if self.config['auto_block'] and not self._ip_flags.get(source_ip, 0) & IP_WHITELISTED:
+            self.blocked_ips.add(source_ip)
+            self._flag_ip(source_ip, IP_BLOCKED)
+            print(f"Auto-blocked IP for DDoS: {_ip_str(source_ip)}")
+        
+        return True
+    
+    def analyze_packet(self, packet):
+        """Analyze individual packet for threats"""
+        self.packet_count += 1
+        current_time = time.time()
+        
+        # Parse IP header
+        ip_info = self.parse_ip_header(packet)
+        if not ip_info:
+            return
+        
+        # Parse TCP header
+        dest_port = flags = payload = None
+        if ip_info.protocol == 6:  # TCP
+            tcp_info = self.parse_tcp_header(packet, ip_info.header_length)
+            if tcp_info:
+                dest_port = tcp_info.destination_port
+                flags = tcp_info.flags
+                payload = packet[ip_info.header_length + tcp_info.header_length:]
+        
+        self._inspect(current_time, ip_info.source_ip, ip_info.destination_ip, dest_port, flags, payload)
+    
+    def analyze_headers(self, headers, payloads=None, offsets=None):
+        """Analyze a batch of packets given as a HEADER_DTYPE array, e.g. an
+        np.frombuffer overlay of back-to-back 40-byte IPv4+TCP headers.
+        TCP payloads, when given, are packed back to back in `payloads` with
+        packet i's spanning offsets[i]:offsets[i + 1]"""
+        count = headers.size
+        if not count:
+            return
+        self.packet_count += count
+        current_time = time.time()
+        
+        # Decode every field column-wise; the TCP overlay is only valid without IP options
+        is_tcp = ((headers['protocol'] == 6) & (headers['ver_ihl'] & 0xF == 5)).tolist()
+        dest_ports = headers['dest_port'].tolist()
+        flags = headers['flags'].tolist()
+        
+        source_ips = headers['source_ip'].tolist()
+        dest_ips = headers['dest_ip'].tolist()
+        
+        if payloads is not None and self.signature_scanner.signatures:
+            bounds = np.frombuffer(offsets, dtype=np.uint32, count=count + 1).tolist()
+        else:
+            bounds = None
+        
+        for i in range(count):
+            # A packet that fails analysis is dropped alone, as in the Python capture loop
+            try:
+                if is_tcp[i]:
+                    payload = bytes(payloads[bounds[i]:bounds[i + 1]]) if bounds else None
+                    self._inspect(current_time, source_ips[i], dest_ips[i], dest_ports[i], flags[i], payload)
+                else:
+                    self._inspect(current_time, source_ips[i], dest_ips[i], None, None)
+            except Exception as e:
+                print(f"Error analyzing packet: {e}")
+    
+    def detect_signatures(self, source_ip, dest_ip, dest_port, payload):
+        """Detect known attack signatures in a TCP payload"""
+        matches = self._shard(source_ip)['scanner'].scan(payload)
+        if not matches:
+            return False
+        
+        current_time = time.time()
+        for sig in matches:
+            _, title, severity = self.signature_scanner.signatures[sig]
             alert = {
-                'id': f"ddos_{int(current_time)}",
-                'type': 'high',
-                'title': 'DDoS Attack Detected',
-                'description': f'IP {source_ip} sent {len(recent_packets)} packets in 1 second',
-                'timestamp': datetime.now().isoformat(),
-                'source_ip': source_ip,
-                'destination_ip': 'multiple',
+                'id': f"sig_{int(current_time)}_{sig}",
+                'type': severity,
+                'title': title,
+                'description': f'Payload from IP {_ip_str(source_ip)} to port {dest_port} matched signature {sig}',
+                'ts': current_time,
+                'source_ip': _ip_str(source_ip),
+                'destination_ip': _ip_str(dest_ip),
                 'status': 'active'
             }
-            self.alerts.append(alert)
-            self.suspicious_packets += 1
+            self._record_alert(alert)
             
             # Track investigation data
-            if source_ip not in self.ip_investigation_data:
+            if not self._ip_flags.get(source_ip, 0) & IP_INVESTIGATED:
+                self._flag_ip(source_ip, IP_INVESTIGATED)
                 self.ip_investigation_data[source_ip] = {
-                    'first_seen': datetime.now().isoformat(),
+                    'first_seen': current_time,
                     'activities': [],
-                    'ports_accessed': [],
+                    'ports_accessed': set(),
                     'classification': 'unknown',
                     'notes': ''
                 }
             
             self.ip_investigation_data[source_ip]['activities'].append({
-                'timestamp': datetime.now().isoformat(),
-                'action': 'DDoS Attack Detected',
-                'details': f'Sent {len(recent_packets)} packets in 1 second',
-                'severity': 'high'
+                'ts': current_time,
+                'action': title,
+                'details': f'Matched signature {sig} on port {dest_port}',
+                'severity': severity
             })
-            
-            if self.config['auto_block'] and source_ip not in self.whitelisted_ips:
-                self.blocked_ips.add(source_ip)
-                print(f"Auto-blocked IP for DDoS: {source_ip}")
-            
-            return True
-        return False
+        
+        self.suspicious_packets += 1
+        return True
     
-    def analyze_packet(self, packet):
-        """Analyze individual packet for threats"""
-        self.packet_count += 1
-        current_time = time.time()
+    def _flag_ip(self, ip, flag):
+        """Set an IP_* state bit for `ip`"""
+        self._ip_flags[ip] = self._ip_flags.get(ip, 0) | flag
+    
+    def _track_connection(self, source_ip, now):
+        """Push monotonic time `now` into the source's timestamp ring"""
+        shard = self._shard(source_ip)
+        conn = shard['conn']
+        if now >= shard['next_sweep']:
+            shard['next_sweep'] = now + IDLE_SWEEP_INTERVAL
+            self._evict_idle(shard, now)
         
-        # Parse IP header
-        ip_info = self.parse_ip_header(packet)
-        if not ip_info:
-            return
+        buf, head = conn.get(source_ip, (None, 0))
+        if buf is None or buf.size <= self.config['ddos_threshold']:
+            buf, head = self._grow_ring(buf, head)
+        conn[source_ip] = (buf, push_ts(buf, head, now))
+    
+    def _evict_idle(self, shard, now):
+        """Drop the rings of sources whose newest timestamp is over IDLE_TIMEOUT old,
+        and port entries whose port-scan window has expired"""
+        conn, ports = shard['conn'], shard['ports']
+        cutoff = now - IDLE_TIMEOUT
+        idle = [ip for ip, (buf, head) in conn.items() if buf[(head - 1) % buf.size] < cutoff]
+        for ip in idle:
+            del conn[ip]
         
-        source_ip = ip_info['source_ip']
-        dest_ip = ip_info['destination_ip']
+        # _track_port would reset these on the source's next packet anyway
+        window = self.config['port_scan_window']
+        expired = [ip for ip, entry in ports.items() if now - entry[3] >= window]
+        for ip in expired:
+            del ports[ip]
+    
+    def _grow_ring(self, buf, head):
+        """New ring of twice `ddos_threshold` timestamps, keeping the old ones in order"""
+        size = max(RING_SIZE, 2 * self.config['ddos_threshold'])
+        ring = np.zeros(size)
+        if buf is None:
+            return ring, 0
+        # Unroll the old ring oldest-first, then keep as many of the newest as fit
+        ordered = np.roll(buf, -(head % buf.size)) if head > buf.size else buf[:head]
+        ordered = ordered[-size:]
+        ring[:ordered.size] = ordered
+        return ring, ordered.size
+    
+    def _inspect(self, current_time, source_ip, dest_ip, dest_port, flags, payload=None):
+        """Run threat detection for one decoded packet (uint32 addresses; dest_port is None unless TCP)"""
+        # One lookup answers blocked / whitelisted / under investigation
+        ip_flags = self._ip_flags.get(source_ip, 0)
         
         # Skip if IP is blocked
-        if source_ip in self.blocked_ips:
+        if ip_flags & IP_BLOCKED:
             return
             
         # Skip threat detection for whitelisted IPs
-        if source_ip in self.whitelisted_ips:
+        if ip_flags & IP_WHITELISTED:
             # Still track connections for whitelisted IPs
-            self.connection_tracker[source_ip].append(current_time)
+            self._track_connection(source_ip, time.monotonic())
             return
         
-        # Track connection timing
-        self.connection_tracker[source_ip].append(current_time)
-        
-        # Clean old entries (keep only last 60 seconds)
-        self.connection_tracker[source_ip] = [
-            t for t in self.connection_tracker[source_ip] 
-            if current_time - t < 60
-        ]
+        # Track connection timing (the ring overwrites its oldest entries)
+        self._track_connection(source_ip, time.monotonic())
         
         # Analyze TCP packets
-        if ip_info['protocol'] == 6:  # TCP
-            tcp_info = self.parse_tcp_header(packet, ip_info['header_length'])
-            if tcp_info:
-                dest_port = tcp_info['destination_port']
-                
-                # Check for port scanning
-                self.detect_port_scan(source_ip, dest_port)
-                
-                # Check for DDoS
-                self.detect_ddos(source_ip)
-                
-                # Log traffic
-                traffic_entry = {
-                    'timestamp': current_time,
-                    'source_ip': source_ip,
-                    'dest_ip': dest_ip,
-                    'dest_port': dest_port,
-                    'protocol': 'TCP',
-                    'flags': tcp_info['flags']
-                }
-                self.traffic_history.append(traffic_entry)
-                
-                # Update investigation data
-                if source_ip in self.ip_investigation_data:
-                    if dest_port not in self.ip_investigation_data[source_ip].get('ports_accessed', []):
-                        self.ip_investigation_data[source_ip]['ports_accessed'].append(dest_port)
+        if dest_port is not None:
+            # Check for port scanning
+            alerted = self.detect_port_scan(source_ip, dest_port)
+            
+            # Check for DDoS
+            alerted |= self.detect_ddos(source_ip)
+            
+            # Check the payload against known attack signatures
+            if payload:
+                alerted |= self.detect_signatures(source_ip, dest_ip, dest_port, payload)
+            
+            # Detections may have opened an investigation or auto-blocked the IP
+            if alerted:
+                ip_flags = self._ip_flags[source_ip]
+            
+            # Log traffic
+            i = self._hist_head % HISTORY_SIZE
+            self._hist_ts[i] = current_time
+            self._hist_src[i] = source_ip
+            self._hist_dst[i] = dest_ip
+            self._hist_dport[i] = dest_port
+            self._hist_flags[i] = flags
+            self._hist_head += 1
+            
+            # Update investigation data
+            if ip_flags & IP_INVESTIGATED:
+                self.ip_investigation_data[source_ip]['ports_accessed'].add(dest_port)
+    
+    def get_traffic_history(self, limit=HISTORY_SIZE):
+        """Most recent logged TCP packets (up to `limit`), oldest first"""
+        count = min(self._hist_head, HISTORY_SIZE, limit)
+        rows = np.arange(self._hist_head - count, self._hist_head) % HISTORY_SIZE
+        return [
+            {
+                'timestamp': ts,
+                'source_ip': _ip_str(source_ip),
+                'dest_ip': _ip_str(dest_ip),
+                'dest_port': dest_port,
+                'protocol': 'TCP',
+                'flags': flags
+            }
+            for ts, source_ip, dest_ip, dest_port, flags in zip(
+                self._hist_ts[rows].tolist(), self._hist_src[rows].tolist(), self._hist_dst[rows].tolist(),
+                self._hist_dport[rows].tolist(), self._hist_flags[rows].tolist())
+        ]
     
     def block_ip(self, ip):
         """Block an IP address"""
-        if ip in self.whitelisted_ips:
+        key = _parse_ip(ip)
+        if key is None:
+            print(f"Invalid IP address: {ip}")
+            return False
+        if key in self.whitelisted_ips:
             print(f"Cannot block whitelisted IP: {ip}")
             return False
             
-        if ip not in self.blocked_ips:
-            self.blocked_ips.add(ip)
+        if key not in self.blocked_ips:
+            self.blocked_ips.add(key)
+            self._flag_ip(key, IP_BLOCKED)
             print(f"Blocked IP: {ip}")
             
             # Update investigation data
-            if ip in self.ip_investigation_data:
-                self.ip_investigation_data[ip]['classification'] = 'malicious'
-                self.ip_investigation_data[ip]['activities'].append({
-                    'timestamp': datetime.now().isoformat(),
+            if key in self.ip_investigation_data:
+                self.ip_investigation_data[key]['classification'] = 'malicious'
+                self.ip_investigation_data[key]['activities'].append({
+                    'ts': time.time(),
                     'action': 'IP Blocked',
                     'details': 'Manually blocked by administrator',
                     'severity': 'info'
@@ -273,19 +872,25 @@ class NetworkMonitor:
     
     def whitelist_ip(self, ip):
         """Whitelist an IP address"""
+        key = _parse_ip(ip)
+        if key is None:
+            print(f"Invalid IP address: {ip}")
+            return False
         # Remove from blocked list if present
-        if ip in self.blocked_ips:
-            self.blocked_ips.remove(ip)
+        if key in self.blocked_ips:
+            self.blocked_ips.remove(key)
+            self._ip_flags[key] &= ~IP_BLOCKED
             
-        if ip not in self.whitelisted_ips:
-            self.whitelisted_ips.add(ip)
+        if key not in self.whitelisted_ips:
+            self.whitelisted_ips.add(key)
+            self._flag_ip(key, IP_WHITELISTED)
             print(f"Whitelisted IP: {ip}")
             
             # Update investigation data
-            if ip in self.ip_investigation_data:
-                self.ip_investigation_data[ip]['classification'] = 'benign'
-                self.ip_investigation_data[ip]['activities'].append({
-                    'timestamp': datetime.now().isoformat(),
+            if key in self.ip_investigation_data:
+                self.ip_investigation_data[key]['classification'] = 'benign'
+                self.ip_investigation_data[key]['activities'].append({
+                    'ts': time.time(),
                     'action': 'IP Whitelisted',
                     'details': 'Manually whitelisted by administrator',
                     'severity': 'info'
@@ -296,36 +901,51 @@ class NetworkMonitor:
     
     def get_ip_investigation_data(self, ip):
         """Get investigation data for an IP"""
-        if ip in self.ip_investigation_data:
-            data = self.ip_investigation_data[ip]
+        key = _parse_ip(ip)
+        if key is None:
+            print(f"Invalid IP address: {ip}")
+            return None
+        if key in self.ip_investigation_data:
+            data = self.ip_investigation_data[key]
             
             # Add current status
-            if ip in self.blocked_ips:
+            if key in self.blocked_ips:
                 status = 'blocked'
-            elif ip in self.whitelisted_ips:
+            elif key in self.whitelisted_ips:
                 status = 'whitelisted'
             else:
                 status = 'monitoring'
-                
-            data['status'] = status
-            data['last_seen'] = datetime.now().isoformat()
             
-            return data
+            # Timestamps are stored raw and ports as a set; both are rendered for output here
+            return {
+                **data,
+                'first_seen': _fmt_ts(data['first_seen']),
+                'ports_accessed': sorted(data['ports_accessed']),
+                'activities': [{**activity, 'timestamp': _fmt_ts(activity['ts'])}
+                               for activity in data['activities']],
+                'status': status,
+                'last_seen': datetime.now().isoformat()
+            }
         
         return None
     
     def update_ip_notes(self, ip, notes):
         """Update investigation notes for an IP"""
-        if ip not in self.ip_investigation_data:
-            self.ip_investigation_data[ip] = {
-                'first_seen': datetime.now().isoformat(),
+        key = _parse_ip(ip)
+        if key is None:
+            print(f"Invalid IP address: {ip}")
+            return False
+        if key not in self.ip_investigation_data:
+            self._flag_ip(key, IP_INVESTIGATED)
+            self.ip_investigation_data[key] = {
+                'first_seen': time.time(),
                 'activities': [],
-                'ports_accessed': [],
+                'ports_accessed': set(),
                 'classification': 'unknown',
                 'notes': ''
             }
             
-        self.ip_investigation_data[ip]['notes'] = notes
+        self.ip_investigation_data[key]['notes'] = notes
         print(f"Updated notes for IP: {ip}")
         return True
     
@@ -333,24 +953,41 @@ class NetworkMonitor:
         """Start network monitoring"""
         print(f"Starting network monitoring on interface: {interface}")
         
+        # Set on exit to stop this run's workers; config['monitoring_enabled'] stays the
+        # user's switch, so a later start_monitoring() captures again
+        stop = threading.Event()
+        sockets = []
+        threads = []
+        # The calling thread runs the first worker; give it its own affinity back afterwards
+        affinity = os.sched_getaffinity(0)
+        
         try:
-            # Create raw socket (requires root privileges)
-            sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.ntohs(0x0003))
-            sock.bind((interface, 0))
+            # Create raw sockets (requires root privileges), one per worker
+            for _ in range(self.workers):
+                sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.ntohs(0x0003))
+                sock.bind((interface, 0))
+                if self.workers > 1:
+                    # Spread packets across the workers' sockets by source address
+                    join_fanout(sock, os.getpid() & 0xFFFF)
+                sockets.append(sock)
+            
+            # Spread the workers over the CPUs servicing the RX queues (wrapping when there are
+            # more workers than queues). Fan-out is by source address rather than by queue, so a
+            # worker still receives packets from every queue: this keeps capture on the NIC's
+            # interrupt CPUs and off each other, not each queue's packets on its own CPU
+            cpus = [cpu for cpu in rx_queue_cpus(interface) if cpu is not None]
+            if not self.config['pin_capture'] or not cpus:
+                cpus = [None]
             
             print("Network monitoring started. Press Ctrl+C to stop.")
             
-            while self.config['monitoring_enabled']:
-                packet = sock.recvfrom(65565)
-                packet_data = packet[0]
-                
-                # Skip Ethernet header (14 bytes) to get to IP header
-                ip_packet = packet_data[14:]
-                self.analyze_packet(ip_packet)
-                
-                # Print stats every 100 packets
-                if self.packet_count % 100 == 0:
-                    self.print_stats()
+            for i, sock in enumerate(sockets[1:], 1):
+                thread = threading.Thread(target=self._capture_worker, args=(sock, cpus[i % len(cpus)], stop),
+                                          daemon=True)
+                thread.start()
+                threads.append(thread)
+            pin_capture(sockets[0], cpus[0])
+            self._capture_loop(sockets[0], stop, announce=True)
                     
         except PermissionError:
             print("Error: Root privileges required for raw socket access")
@@ -360,17 +997,97 @@ class NetworkMonitor:
         except Exception as e:
             print(f"Error during monitoring: {e}")
         finally:
+            # Every receive path wakes at least once a second to see `stop`; wait for the
+            # workers and close the sockets so a later run's fan-out group starts empty
+            stop.set()
+            for thread in threads:
+                thread.join()
+            for sock in sockets:
+                sock.close()
+            try:
+                os.sched_setaffinity(0, affinity)
+            except OSError:
+                pass
             self.print_final_stats()
     
+    def _capture_worker(self, sock, cpu, stop):
+        """Thread entry point for the workers beyond the first"""
+        try:
+            pin_capture(sock, cpu)
+            self._capture_loop(sock, stop)
+        except Exception as e:
+            print(f"Error in capture worker: {e}")
+    
+    def _capture_loop(self, sock, stop, announce=False):
+        """Analyze packets from one capture socket until monitoring is disabled or `stop` is set"""
+        if Capture is not None:
+            # Compiled loop: decode in C, re-enter Python once per batch
+            if announce:
+                print("Capture path: compiled loop (network_monitor_core)")
+            self._run_capture(Capture(sock), stop)
+            return
+        
+        # Prefer the mmap'ed TPACKET_V3 ring, then recvmmsg batches, then one recvfrom per packet
+        try:
+            receive = TPacketV3Ring(sock)
+            path = "TPACKET_V3 ring"
+        except OSError:
+            try:
+                receive = MmsgReceiver(sock)
+                path = "recvmmsg batches"
+            except (AttributeError, OSError):
+                set_receive_timeout(sock, 1000)
+                def receive():
+                    try:
+                        return (sock.recvfrom(65565)[0],)
+                    except BlockingIOError:  # Receive timed out; lets the loop check `stop`
+                        return ()
+                path = "recvfrom"
+        if announce:
+            print(f"Capture path: {path}")
+        
+        while self.config['monitoring_enabled'] and not stop.is_set():
+            for packet_data in receive():
+                # Skip Ethernet header (14 bytes) to get to IP header
+                ip_packet = packet_data[14:]
+                try:
+                    self.analyze_packet(ip_packet)
+                except Exception as e:
+                    print(f"Error analyzing packet: {e}")
+                
+                # Print stats every 100 packets
+                if self.packet_count % 100 == 0:
+                    self.print_stats()
+    
+    def _run_capture(self, capture, stop):
+        """Feed batches from a compiled Capture loop to analyze_headers()"""
+        def on_batch(records, count, payloads, offsets):
+            if count:
+                before = self.packet_count
+                try:
+                    self.analyze_headers(np.frombuffer(records, dtype=HEADER_DTYPE, count=count),
+                                         payloads, offsets)
+                except Exception as e:
+                    # Only a batch that cannot be decoded at all is lost; bad packets are
+                    # skipped one at a time inside analyze_headers
+                    print(f"Error analyzing packet batch: {e}")
+                
+                # Print stats every 100 packets
+                if self.packet_count // 100 != before // 100:
+                    self.print_stats()
+            return self.config['monitoring_enabled'] and not stop.is_set()
+        
+        capture.run(on_batch)
+    
     def print_stats(self):
         """Print current monitoring statistics"""
         print(f"\n--- Network Monitor Stats ---")
         print(f"Total packets analyzed: {self.packet_count}")
         print(f"Suspicious packets: {self.suspicious_packets}")
-        print(f"Active alerts: {len([a for a in self.alerts if a['status'] == 'active'])}")
+        print(f"Active alerts: {self._active_alerts}")
         print(f"Blocked IPs: {len(self.blocked_ips)}")
         print(f"Whitelisted IPs: {len(self.whitelisted_ips)}")
-        print(f"Unique source IPs: {len(self.connection_tracker)}")
+        print(f"Unique source IPs: {self._tracked_ips()}")
         print("-" * 30)
     
     def print_final_stats(self):
@@ -380,22 +1097,22 @@ class NetworkMonitor:
         
         if self.alerts:
             print(f"\n--- Security Alerts ---")
-            for alert in self.alerts[-5:]:  # Show last 5 alerts
+            for alert in islice(self.alerts, max(0, len(self.alerts) - 5), None):  # Show last 5 alerts
                 print(f"[{alert['type'].upper()}] {alert['title']}")
                 print(f"  Source: {alert['source_ip']}")
-                print(f"  Time: {alert['timestamp']}")
+                print(f"  Time: {_fmt_ts(alert['ts'])}")
                 print(f"  Description: {alert['description']}")
                 print()
         
         if self.blocked_ips:
             print(f"--- Blocked IPs ---")
             for ip in self.blocked_ips:
-                print(f"  {ip}")
+                print(f"  {_ip_str(ip)}")
                 
         if self.whitelisted_ips:
             print(f"--- Whitelisted IPs ---")
             for ip in self.whitelisted_ips:
-                print(f"  {ip}")
+                print(f"  {_ip_str(ip)}")
     
     def get_status_json(self):
         """Return current status as JSON for API"""
@@ -404,13 +1121,14 @@ class NetworkMonitor:
                 'total_packets': self.packet_count,
                 'suspicious_packets': self.suspicious_packets,
                 'blocked_ips': len(self.blocked_ips),
-                'active_connections': len(self.connection_tracker),
+                'active_connections': self._tracked_ips(),
                 'system_uptime': '2h 34m',  # Would be calculated in real implementation
                 'last_scan': datetime.now().strftime('%H:%M:%S')
             },
-            'alerts': self.alerts[-10:],  # Return last 10 alerts
-            'blocked_ips': list(self.blocked_ips),
-            'whitelisted_ips': list(self.whitelisted_ips)
+            'alerts': [{**alert, 'timestamp': _fmt_ts(alert['ts'])}  # Return last 10 alerts
+                       for alert in islice(self.alerts, max(0, len(self.alerts) - 10), None)],
+            'blocked_ips': [_ip_str(ip) for ip in self.blocked_ips],
+            'whitelisted_ips': [_ip_str(ip) for ip in self.whitelisted_ips]
         }
 
 def main():